@@ -119,7 +119,8 @@ def mqtt_monitor(env):
 
     for msg, body in client.fetchloop():
         log.info(f"TOPIC [{msg.topic}]")
-        log.debug(enhex(msg.payload[:]))
+        if log.getLogger().isEnabledFor(log.DEBUG):
+            log.debug(enhex(msg.payload[:]))
 
         for obj in body:
             try:
@@ -259,8 +260,8 @@ def pppp_print_file(env, file, no_act):
     env.load_config()
     api = cli.pppp.pppp_open(env.config, env.printer_index, dumpfile=env.pppp_dump)
 
-    data = file.read()
-    fui = FileUploadInfo.from_file(file.name, user_name="ankerctl", user_id="-", machine_id="-")
+    data = cli.util.map_file(file)
+    fui = FileUploadInfo.from_data(data, file.name, user_name="ankerctl", user_id="-", machine_id="-")
     log.info(f"Going to upload {fui.size} bytes as {fui.name!r}")
     try:
         cli.pppp.pppp_send_file(api, fui, data)
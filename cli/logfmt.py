@@ -2,50 +2,50 @@
 import logging
 
 
-class ColorFormatter(logging.Formatter):
+# mark and color used for the prefix of each log level
+_LEVELS = {
+    logging.CRITICAL: ("!", "red"),
+    logging.ERROR:    ("E", "red"),
+    logging.WARNING:  ("W", "yellow"),
+    logging.INFO:     ("*", "green"),
+    logging.DEBUG:    ("D", "magenta"),
+}
+
+# the styled level prefixes never change, so render them once at import time
+_PREFIXES = {
+    level: "".join([
+        click.style("[",  fg="blue",  bold=True),
+        click.style(mark, fg=color,   bold=True),
+        click.style("]",  fg="blue",  bold=True),
+        " ",
+    ])
+    for level, (mark, color) in _LEVELS.items()
+}
+
 
-    def __init__(self, fmt):
-        super().__init__(fmt)
-
-        self._colors = {
-            logging.CRITICAL: "red",
-            logging.ERROR:    "red",
-            logging.WARNING:  "yellow",
-            logging.INFO:     "green",
-            logging.DEBUG:    "magenta",
-        }
-
-        self._marks = {
-            logging.CRITICAL: "!",
-            logging.ERROR:    "E",
-            logging.WARNING:  "W",
-            logging.INFO:     "*",
-            logging.DEBUG:    "D",
-        }
+class ColorFormatter(logging.Formatter):
 
     def format(self, rec):
-        marks, colors = self._marks, self._colors
-        return "".join([
-            click.style("[",                fg="blue",              bold=True),
-            click.style(marks[rec.levelno], fg=colors[rec.levelno], bold=True),
-            click.style("]",                fg="blue",              bold=True),
-            " ",
-            super().format(rec),
-        ])
+        return _PREFIXES[rec.levelno] + super().format(rec)
 
 
-class ExitOnExceptionHandler(logging.StreamHandler):
+class ExitOnCriticalHandler(logging.Handler):
+
+    def __init__(self):
+        # the level check is done by the logging module before emit() is
+        # called, so other records never reach this handler
+        super().__init__(level=logging.CRITICAL)
 
     def emit(self, record):
-        super().emit(record)
-        if record.levelno == logging.CRITICAL:
-            raise SystemExit(127)
+        raise SystemExit(127)
 
 
 def setup_logging(level=logging.INFO):
-    logging.basicConfig(handlers=[ExitOnExceptionHandler()])
+    handler = logging.StreamHandler()
+    handler.setFormatter(ColorFormatter("%(message)s"))
+    # the exit handler must come last, so critical messages are printed
+    # before exiting
+    logging.basicConfig(handlers=[handler, ExitOnCriticalHandler()])
     log = logging.getLogger()
     log.setLevel(level)
-    handler = log.handlers[0]
-    handler.setFormatter(ColorFormatter("%(message)s"))
     return log
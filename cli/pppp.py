@@ -41,8 +41,7 @@ def pppp_open(config, printer_index, timeout=None, dumpfile=None):
         api.connect_lan_search()
         api.start()
 
-        while api.state != PPPPState.Connected:
-            time.sleep(0.1)
+        while not api.connected_event.wait(timeout=0.1):
             if api.stopped.is_set() or (timeout and (datetime.now() > deadline)):
                 api.stop()
                 raise ConnectionRefusedError("Connection rejected by device")
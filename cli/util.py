@@ -1,4 +1,5 @@
 import sys
+import mmap
 import click
 import json
 from flask import make_response, abort
@@ -52,21 +53,19 @@ class FileSizeType(click.ParamType):
 
     name = "filesize"
 
+    # multiplier for each supported size suffix
+    units = {
+        "k": 1 << 10,
+        "m": 1 << 20,
+        "g": 1 << 30,
+        "t": 1 << 40,
+    }
+
     def convert(self, value, param, ctx):
         value = value.lower().rstrip("b")
         try:
-            num = int(value[:-1])
-            if value.endswith("k"):
-                return num * 1024**1
-            elif value.endswith("m"):
-                return num * 1024**2
-            elif value.endswith("g"):
-                return num * 1024**3
-            elif value.endswith("t"):
-                return num * 1024**4
-            else:
-                raise ValueError()
-        except ValueError:
+            return int(value[:-1]) * self.units[value[-1:]]
+        except (ValueError, KeyError):
             self.fail("Invalid file size: use {kb,gb,mb,tb} suffix (examples: 1337kb, 42mb, 17gb)", param, ctx)
 
 
@@ -104,8 +103,20 @@ def pretty_size(size):
 
 
 def split_chunks(data, chunksize):
-    for offset in range(0, len(data), chunksize):
-        yield offset, data[offset:offset+chunksize]
+    # slicing a memoryview does not copy the underlying data
+    view = memoryview(data)
+    for offset in range(0, len(view), chunksize):
+        yield offset, view[offset:offset+chunksize]
+
+
+def map_file(fd):
+    # map regular files into memory, so the kernel pages them in on demand
+    # while they are being sent. pipes and empty files cannot be mapped, so
+    # fall back to reading those.
+    try:
+        return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return fd.read()
 
 
 def parse_http_bool(str):
@@ -41,7 +41,8 @@ def wrapper(self, *args, **kwargs):
         data = func(self, *args, **kwargs)
         if data.ok:
             jsn = data.json()
-            log.debug(f"JSON result: {json.dumps(jsn, indent=4)}")
+            if log.getLogger().isEnabledFor(log.DEBUG):
+                log.debug(f"JSON result: {json.dumps(jsn, indent=4)}")
             if jsn["code"] == 0:
                 data = jsn.get("data")
                 return data
@@ -121,7 +121,7 @@ def make_mqtt_pkt(guid, data, packet_type=MqttPktType.Single, packet_num=0):
 
     def send(self, topic, msg):
         payload = self.make_mqtt_pkt(self._guid, json.dumps(msg).encode())
-        log.debug(f"Sending mqtt command on [{topic}]: {payload}")
+        log.debug("Sending mqtt command on [%s]: %s", topic, payload)
         return self.send_raw(topic, payload)
 
     def query(self, msg):
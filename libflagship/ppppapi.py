@@ -1,4 +1,5 @@
 import os
+import time
 import socket
 import string
 import hashlib
@@ -6,7 +7,6 @@
 
 from enum import Enum
 from multiprocessing import Pipe
-from datetime import datetime, timedelta
 from threading import Thread, Event, Lock
 from socket import AF_INET
 from dataclasses import dataclass
@@ -54,8 +54,9 @@ def sanitize(c):
 
     @classmethod
     def from_file(cls, filename, user_name, user_id, machine_id, type=0):
-        data = open(filename, "rb").read()
-        return cls.from_data(data, filename, user_name, user_id, machine_id, type=0)
+        with open(filename, "rb") as fd:
+            data = fd.read()
+        return cls.from_data(data, filename, user_name, user_id, machine_id, type=type)
 
     @classmethod
     def from_data(cls, data, filename, user_name, user_id, machine_id, type=0):
@@ -78,8 +79,10 @@ def __bytes__(self):
 
 class Wire:
 
+    __slots__ = ("buf", "rx", "tx")
+
     def __init__(self):
-        self.buf = []
+        self.buf = bytearray()
         self.rx, self.tx = Pipe(False)
 
     def peek(self, size, timeout=None):
@@ -89,27 +92,37 @@ def peek(self, size, timeout=None):
             timeout = 0.000001
 
         if timeout is not None:
-            deadline = datetime.now() + timedelta(seconds=timeout)
+            deadline = time.monotonic() + timeout
 
         while len(self.buf) < size:
-            if timeout and not self.rx.poll(timeout=(deadline - datetime.now()).total_seconds()):
+            if timeout and not self.rx.poll(timeout=deadline - time.monotonic()):
                 return None
-            self.buf.extend(self.rx.recv())
+            self.buf += self.rx.recv()
 
         return bytes(self.buf[:size])
 
     def read(self, size, timeout=None):
         res = self.peek(size, timeout)
         if res:
-            self.buf = self.buf[size:]
+            del self.buf[:size]
         return res
 
     def write(self, data):
         self.tx.send(data)
 
+    def close(self):
+        self.rx.close()
+        self.tx.close()
+
 
 class Channel:
 
+    # channels are touched for every packet, so avoid per-instance dicts
+    __slots__ = (
+        "index", "rxqueue", "txqueue", "backlog", "rx_ctr", "tx_ctr", "tx_ack", "rx", "tx",
+        "timeout_ns", "acks", "event", "max_in_flight", "max_age_warn", "lock",
+    )
+
     def __init__(self, index, max_in_flight=64, max_age_warn=128):
         self.index = index
         self.rxqueue = {}
@@ -120,7 +133,8 @@ def __init__(self, index, max_in_flight=64, max_age_warn=128):
         self.tx_ack = CyclicU16(0)
         self.rx = Wire()
         self.tx = Wire()
-        self.timeout = timedelta(seconds=0.5)
+        # retransmit timeout, in nanoseconds
+        self.timeout_ns = 500_000_000
         self.acks = set()
         self.event = Event()
         self.max_in_flight = max_in_flight
@@ -145,39 +159,45 @@ def rx_drw(self, index, data):
         # drop any packets we have already recieved
         if self.rx_ctr > index:
             if self.max_age_warn and (self.rx_ctr - index > self.max_age_warn):
-                log.warn(f"Dropping old packet: index {index} while expecting {self.rx_ctr}.")
+                log.warning("Dropping old packet: index %s while expecting %s.", index, self.rx_ctr)
             return
 
         # record packet in queue
         self.rxqueue[index] = data
 
         # recombine data from queue
+        parts = []
         while self.rx_ctr in self.rxqueue:
-            data = self.rxqueue[self.rx_ctr]
-            del self.rxqueue[self.rx_ctr]
+            parts.append(self.rxqueue.pop(self.rx_ctr))
             self.rx_ctr += 1
-            self.rx.write(data)
+
+        # pass all data that is now in order to the reader in a single write
+        if parts:
+            self.rx.write(b"".join(parts))
 
     def poll(self):
         # signal event to make blocking reads check status again
         self.event.set()
 
         txq = self.txqueue
+        free = self.max_in_flight - len(txq)
 
-        if self.backlog and len(txq) < self.max_in_flight:
-            while self.backlog and len(txq) < self.max_in_flight:
-                txq.append(self.backlog.pop(0))
+        if self.backlog and free > 0:
+            # move as many packets as the window allows in a single batch
+            batch = self.backlog[:free]
+            txq.extend(batch)
+            del self.backlog[:len(batch)]
 
             # sort list to make sure oldest deadline is first
             txq.sort()
 
         res = []
-        now = datetime.now()
+        now = time.monotonic_ns()
 
         while txq and txq[0][0] < now:
             deadline, index, pkt = txq.pop(0)
             res.append(PktDrw(chan=self.index, index=index, data=pkt))
-            txq.append((deadline + self.timeout, index, pkt))
+            txq.append((deadline + self.timeout_ns, index, pkt))
 
         # the returned chunks will be (re)transmitted
         return res
@@ -192,16 +212,21 @@ def peek(self, nbytes, timeout=None):
     def read(self, nbytes, timeout=None):
         return self.rx.read(nbytes, timeout)
 
+    def close(self):
+        self.rx.close()
+        self.tx.close()
+
     def write(self, payload, block=True):
-        pdata = payload[:]
+        view = memoryview(payload)
 
         tx_ctr_start = self.tx_ctr
 
-        # schedule all packets, starting from current time
-        deadline = datetime.now()
-        while pdata:
+        # schedule all packets, starting from current time. use the monotonic
+        # clock, so wall clock adjustments cannot stall (or flood) the window.
+        deadline = time.monotonic_ns()
+        for offset in range(0, len(view), 1024):
             # schedule transmission in 1kb chunks
-            data, pdata = pdata[:1024], pdata[1024:]
+            data = bytes(view[offset:offset+1024])
             self.backlog.append((deadline, self.tx_ctr, data))
             self.tx_ctr += 1
 
@@ -233,6 +258,7 @@ def __init__(self, sock, duid, addr=None):
         self.duid = duid
         self.addr = addr
 
+        self.connected_event = Event()
         self.state = PPPPState.Idle
         self.chans = [Channel(n) for n in range(8)]
 
@@ -262,6 +288,20 @@ def open_broadcast(cls, bind_addr=None):
         addr = ("255.255.255.255", PPPP_LAN_PORT)
         return cls(sock, duid=None, addr=addr)
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        # keep self.connected_event in sync, so callers can block until the
+        # connection is up instead of polling the state
+        self._state = state
+        if state == PPPPState.Connected:
+            self.connected_event.set()
+        else:
+            self.connected_event.clear()
+
     def connect_lan_search(self):
         self.state = PPPPState.Connecting
         self.send(PktLanSearch())
@@ -273,6 +313,11 @@ def stop(self):
         self.running = False
         self.stopped.wait()
 
+    def close(self):
+        for ch in self.chans:
+            ch.close()
+        self.sock.close()
+
     def run(self):
         log.debug("Started pppp thread")
         while self.running:
@@ -354,7 +399,7 @@ def recv(self, timeout=None):
         if self.dumper:
             self.dumper.rx(data, self.addr)
         msg = Message.parse(data)[0]
-        log.debug(f"RX <--  {str(msg)[:128]}")
+        log.debug("RX <--  %.128s", msg)
         return msg
 
     def send(self, pkt, addr=None):
@@ -364,8 +409,10 @@ def send(self, pkt, addr=None):
         resp = pkt.pack()
         if self.dumper:
             self.dumper.tx(resp, self.addr)
-        msg = Message.parse(resp)[0]
-        log.debug(f"TX  --> {str(msg)[:128]}")
+        if log.getLogger().isEnabledFor(log.DEBUG):
+            # re-parsing the packet is only needed for the debug output
+            msg = Message.parse(resp)[0]
+            log.debug(f"TX  --> {str(msg)[:128]}")
         self.sock.sendto(resp, addr or self.addr)
 
     def send_xzyh(self, data, cmd, chan=0, unk0=0, unk1=0, sign_code=0, unk3=0, dev_type=0, block=True):
@@ -393,6 +440,15 @@ def send_aabb(self, data, sn=0, pos=0, frametype=0, chan=1, block=True):
 
         return self.chans[chan].write(aabb.pack_with_crc(data), block=block)
 
+    def recv_aabb(self, chan=1):
+        fd = self.chans[chan]
+
+        data = fd.read(12)
+        aabb = Aabb.parse(data)[0]
+        p = data + fd.read(aabb.len + 2)
+        aabb, data = Aabb.parse_with_crc(p)[:2]
+        return aabb, data
+
 
 class AnkerPPPPApi(AnkerPPPPBaseApi):
 
@@ -417,15 +473,6 @@ def recv_xzyh(self, chan=1, timeout=None):
             xzyh.data = data[16:]
             return xzyh
 
-    def recv_aabb(self, chan=1):
-        fd = self.chans[chan]
-
-        data = fd.read(12)
-        aabb = Aabb.parse(data)[0]
-        p = data + fd.read(aabb.len + 2)
-        aabb, data = Aabb.parse_with_crc(p)[:2]
-        return aabb, data
-
     def recv_aabb_reply(self, chan=1, check=True):
         aabb, data = self.recv_aabb(chan=chan)
         if len(data) != 1:
@@ -27,9 +27,9 @@
     - config: Handles configuration manipulation for ankerctl
 """
 import json
+import time
 import logging as log
 
-from datetime import datetime
 from secrets import token_urlsafe as token
 from flask import Flask, flash, request, render_template, Response, session, url_for, jsonify
 from flask_sock import Sock
@@ -76,7 +76,7 @@ def mqtt(sock):
     if not app.config["login"]:
         return
     for data in app.svc.stream("mqttqueue"):
-        log.debug(f"MQTT message: {data}")
+        log.debug("MQTT message: %s", data)
         sock.send(json.dumps(data))
 
 
@@ -103,21 +103,34 @@ def pppp_state(sock):
 
     # A timeout of 3 sec should be fine, as the printer continuously sends
     # PktAlive messages every second on an established connection.
-    for chan, msg in app.svc.stream("pppp", timeout=3.0):
-        if not pppp_connected:
-            with app.svc.borrow("pppp") as pppp:
-                if pppp.connected:
-                    pppp_connected = True
-                    # this is the only message ever sent on this connection
-                    # to signal that the pppp connection is up
-                    sock.send(json.dumps({"status": "connected"}))
-                    log.info(f"PPPP connection established")
+    stream = app.svc.stream("pppp", timeout=3.0)
+
+    for chan, msg in stream:
+        with app.svc.borrow("pppp") as pppp:
+            if pppp.connected:
+                pppp_connected = True
+                # this is the only message ever sent on this connection
+                # to signal that the pppp connection is up
+                sock.send(json.dumps({"status": "connected"}))
+                log.info(f"PPPP connection established")
+                break
+
+    # once connected, only keep consuming messages until the stream ends
+    for _ in stream:
+        pass
+
     if not pppp_connected:
-        log.warning(f'[{datetime.now().strftime("%d/%b/%Y %H:%M:%S")}] PPPP connection lost, restarting PPPPService')
-        try:
-            app.svc.get("pppp").worker_start()
-        except TimeoutError:
-            app.svc.get("pppp").restart()
+        log.warning(f'[{time.strftime("%d/%b/%Y %H:%M:%S")}] PPPP connection lost')
+        # restart through the service state machine, so the connect runs on
+        # the service thread. this socket no longer holds pppp here, so if it
+        # was the only user, pppp is already stopping and restart() leaves it
+        # stopped until the next client asks for it.
+        pppp = app.svc.svcs.get("pppp")
+        if pppp:
+            try:
+                pppp.restart()
+            except ServiceStoppedError:
+                pass
 
 
 @sock.route("/ws/ctrl")
@@ -1,12 +1,12 @@
+import time
 import atexit
+import itertools
 import logging as log
 import contextlib
 
 from enum import Enum
-from threading import Thread, Event
-from datetime import datetime, timedelta
-from multiprocessing import Queue
-from queue import Empty
+from threading import Thread, Event, Lock, Condition
+from queue import Queue, Empty
 
 
 class Holdoff:
@@ -15,13 +15,13 @@ def __init__(self):
         self.deadline = None
 
     def reset(self, delay=None):
-        self.deadline = datetime.now()
+        self.deadline = time.monotonic()
         if delay:
-            self.deadline += timedelta(seconds=delay)
+            self.deadline += delay
 
     @property
     def passed(self):
-        return datetime.now() > self.deadline
+        return time.monotonic() > self.deadline
 
 
 class ServiceError(Exception):
@@ -52,12 +52,17 @@ class Service(Thread):
 
     def __init__(self):
         super().__init__()
+        self._state_changed = Condition()
         self.running = True
         self.deadline = None
         self.state = RunState.Stopped
         self.wanted = False
+        self._restart_reason = None
         self._event = Event()
-        self.handlers = []
+        self.handlers = ()
+        self._handlers = {}
+        self._handler_tokens = itertools.count()
+        self._handlers_lock = Lock()
         self._holdoff = Holdoff()
         self.daemon = True
         super().start()
@@ -66,15 +71,43 @@ def __init__(self):
     def name(self):
         return type(self).__name__
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        with self._state_changed:
+            self._state = state
+            self._state_changed.notify_all()
+
+    def _await_state(self, predicate, timeout):
+        # wake up as soon as the state (or wanted flag) changes, rather than
+        # sharing (and clearing) the service thread's own wakeup event. the
+        # predicate is checked under the lock, so no notification is missed.
+        with self._state_changed:
+            self._state_changed.wait_for(predicate, timeout=timeout)
+
+    def _wake_waiters(self):
+        with self._state_changed:
+            self._state_changed.notify_all()
+
+    def request_restart(self, reason=""):
+        # ask the run loop to restart the worker once worker_run() returns.
+        # cheaper than raising ServiceRestartSignal, which is still supported.
+        self._restart_reason = reason
+
     def start(self):
         log.info(f"{self.name}: Requesting start")
         self.wanted = True
         self._event.set()
+        self._wake_waiters()
 
     def stop(self):
         log.info(f"{self.name}: Requesting stop")
         self.wanted = False
         self._event.set()
+        self._wake_waiters()
 
     def restart(self):
         log.info(f"{self.name}: Requesting restart")
@@ -92,6 +125,7 @@ def shutdown(self):
 
         self.running = False
         self._event.set()
+        self._wake_waiters()
         return self.join()
 
     def idle(self, timeout=None):
@@ -99,6 +133,9 @@ def idle(self, timeout=None):
             self._event.clear()
 
     def _attempt_start(self):
+        # a restart requested by a previous run of the worker does not apply
+        # to this one
+        self._restart_reason = None
         try:
             log.debug(f"{self.name} worker starting..")
             self.worker_start()
@@ -122,15 +159,26 @@ def _attempt_start(self):
     def _attempt_run(self):
         try:
             self.worker_run(timeout=0.1)
-        except ServiceRestartSignal:
-            log.info(f"{self.name}: Service requested restart.")
-            self._holdoff.reset(delay=10)
-            self.state = RunState.Stopping
+        except ServiceRestartSignal as E:
+            self._restart_worker(str(E))
         except Exception:
             log.exception(f"{self.name}: Unexpected exception while running worker")
             log.warning(f"{self.name}: Stopping worker due to exception")
+            self._restart_reason = None
             self._holdoff.reset()
             self.state = RunState.Stopping
+        else:
+            if self._restart_reason is not None:
+                self._restart_worker(self._restart_reason)
+
+    def _restart_worker(self, reason):
+        if reason:
+            log.info(f"{self.name}: Service requested restart: {reason}")
+        else:
+            log.info(f"{self.name}: Service requested restart.")
+        self._restart_reason = None
+        self._holdoff.reset(delay=10)
+        self.state = RunState.Stopping
 
     def _attempt_stop(self):
         try:
@@ -178,7 +226,9 @@ def run(self):
 
         log.debug(f"{self.name}: Shutting down thread")
         if self.state == RunState.Running:
-            self.handlers.clear()
+            with self._handlers_lock:
+                self._handlers.clear()
+                self.handlers = ()
             self.worker_stop()
         log.debug(f"{self.name}: Thread exit")
 
@@ -194,21 +244,42 @@ def worker_run(self, timeout):
     def worker_stop(self):
         pass
 
+    def register_handler(self, handler):
+        # handlers are stored by a unique token, so the same handler can be
+        # registered more than once, and unregistering does not need a search.
+        # the handler tuple is replaced on every change (instead of modified
+        # in place), so notify() can iterate it without taking a copy.
+        with self._handlers_lock:
+            token = next(self._handler_tokens)
+            self._handlers[token] = handler
+            self.handlers = tuple(self._handlers.values())
+        return token
+
+    def unregister_handler(self, token):
+        with self._handlers_lock:
+            del self._handlers[token]
+            self.handlers = tuple(self._handlers.values())
+
     def notify(self, data):
         for handler in self.handlers:
             handler(data)
 
     @contextlib.contextmanager
     def tap(self, handler):
-        self.handlers.append(handler)
+        token = self.register_handler(handler)
         try:
             yield self
         finally:
-            self.handlers.remove(handler)
+            self.unregister_handler(token)
 
     def await_ready(self):
+        def done():
+            return not (self.running and self.wanted) or self.state == RunState.Running
+
         while True:
-            log.debug(f"{self.name}: Awaiting ready ({self.state})")
+            log.debug("%s: Awaiting ready (%s)", self.name, self.state)
+            self._await_state(done, timeout=0.4)
+
             if not (self.running and self.wanted):
                 raise ServiceStoppedError(f"{self.name}: Waiting for stopped thread")
 
@@ -216,10 +287,13 @@ def await_ready(self):
                 log.debug(f"{self.name}: Ready")
                 return True
 
-            self.idle(timeout=0.4)
-
     def await_stopped(self):
+        def done():
+            return self.wanted or self.state == RunState.Stopped
+
         while True:
+            self._await_state(done, timeout=0.4)
+
             if self.wanted:
                 log.warning(f"{self.name}: Service started while waiting for it to stop")
                 return False
@@ -228,8 +302,6 @@ def await_stopped(self):
                 log.debug(f"{self.name}: Stopped")
                 return True
 
-            self.idle(timeout=0.4)
-
 
 class ServiceManager:
 
@@ -264,9 +336,11 @@ def atexit(self):
         log.info("ServiceManager: Shutdown complete")
 
     def dump(self):
+        if not log.getLogger().isEnabledFor(log.DEBUG):
+            return
+
         log.debug("Service state")
-        for name in self.svcs:
-            svc = self.svcs[name]
+        for name, svc in self.svcs.items():
             ref = self.refs[name]
             log.debug(f"  [{ref:>4}] {name:20} running={svc.running} state={svc.state} wanted={svc.wanted}")
 
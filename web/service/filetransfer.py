@@ -1,7 +1,7 @@
 import uuid
 import logging as log
 
-from multiprocessing import Queue
+from queue import Queue
 
 from ..lib.service import Service
 from .. import app
@@ -21,15 +21,22 @@ def api_aabb(self, api, frametype, msg=b"", pos=0):
     def api_aabb_request(self, api, frametype, msg=b"", pos=0):
         self.api_aabb(api, frametype, msg, pos)
         resp = self._tap.get()
-        log.debug(f"{self.name}: Aabb response: {resp}")
+        log.debug("%s: Aabb response: %s", self.name, resp)
 
     def send_file(self, fd, user_name):
-        try:
-            api = self.pppp._api
-        except AttributeError:
+        api = self.pppp._api
+        if api is None:
             raise ConnectionError("No pppp connection to printer")
 
-        data = fd.read()
+        # werkzeug spools uploads over 500KB to a temporary file, so map that
+        # directly. smaller uploads are still held in memory, and fileno()
+        # would write them out to disk first, so just read those.
+        stream = fd.stream
+        stream.seek(0)
+        if getattr(stream, "_rolled", True):
+            data = cli.util.map_file(stream)
+        else:
+            data = stream.read()
         fui = FileUploadInfo.from_data(data, fd.filename, user_name=user_name, user_id="-", machine_id="-")
         log.info(f"Going to upload {fui.size} bytes as {fui.name!r}")
         try:
@@ -61,13 +68,13 @@ def worker_start(self):
         self.pppp = app.svc.get("pppp")
         self._tap = Queue()
 
-        self.pppp.handlers.append(self.handler)
+        self._handler_token = self.pppp.register_handler(self.handler)
 
     def worker_run(self, timeout):
         self.idle(timeout=timeout)
 
     def worker_stop(self):
-        self.pppp.handlers.remove(self.handler)
+        self.pppp.unregister_handler(self._handler_token)
         del self._tap
 
         app.svc.put("pppp")
@@ -19,8 +19,9 @@ def worker_start(self):
 
     def worker_run(self, timeout):
         for msg, body in self.client.fetch(timeout=timeout):
-            log.info(f"TOPIC [{msg.topic}]")
-            log.debug(enhex(msg.payload[:]))
+            log.info("TOPIC [%s]", msg.topic)
+            if log.getLogger().isEnabledFor(log.DEBUG):
+                log.debug(enhex(msg.payload[:]))
 
             for obj in body:
                 self.notify(obj)
@@ -1,27 +1,69 @@
 import json
+import time
 import logging as log
 
-from datetime import datetime, timedelta
-
-from ..lib.service import Service, ServiceRestartSignal, ServiceStoppedError
+from ..lib.service import Service, ServiceStoppedError
 from .. import app
 
 from libflagship.pktdump import PacketWriter
-from libflagship.pppp import P2PCmdType, PktClose, Duid, Type, Xzyh, Aabb
+from libflagship.pppp import P2PCmdType, PktClose, Duid, Type, Xzyh
 from libflagship.ppppapi import AnkerPPPPAsyncApi, PPPPState
 
 
 class PPPPService(Service):
 
-    def api_command(self, commandType, **kwargs):
-        if not hasattr(self, "_api"):
-            raise ConnectionError("No pppp connection")
+    # set while a pppp connection is established
+    _api = None
+
+    def __init__(self):
+        # handlers for a single (channel, message type), see add_msg_handler()
+        self._msg_handlers = {}
+        super().__init__()
+
+    def add_msg_handler(self, chan, msg_type, handler):
+        # handlers registered here are only called for matching messages,
+        # instead of having to inspect (and ignore) every message themselves
+        key = (chan, msg_type)
+        with self._handlers_lock:
+            self._msg_handlers[key] = self._msg_handlers.get(key, ()) + (handler,)
+
+    def remove_msg_handler(self, chan, msg_type, handler):
+        key = (chan, msg_type)
+        with self._handlers_lock:
+            handlers = list(self._msg_handlers.get(key, ()))
+            handlers.remove(handler)
+            if handlers:
+                self._msg_handlers[key] = tuple(handlers)
+            else:
+                del self._msg_handlers[key]
+
+    def notify_msg(self, chan, msg):
+        msg_handlers = self._msg_handlers.get((chan, type(msg)), ())
+        if not (self.handlers or msg_handlers):
+            return
+
+        data = (chan, msg)
+        self.notify(data)
+        for handler in msg_handlers:
+            handler(data)
+
+    @staticmethod
+    def encode_command(commandType, **kwargs):
         cmd = {
             "commandType": commandType,
             **kwargs
         }
-        return self._api.send_xzyh(
-            json.dumps(cmd).encode(),
+        return json.dumps(cmd).encode()
+
+    def api_command(self, commandType, **kwargs):
+        return self.api_command_encoded(self.encode_command(commandType, **kwargs))
+
+    def api_command_encoded(self, payload):
+        api = self._api
+        if api is None:
+            raise ConnectionError("No pppp connection")
+        return api.send_xzyh(
+            payload,
             cmd=P2PCmdType.P2P_JSON_CMD,
             block=False
         )
@@ -29,7 +71,7 @@ def api_command(self, commandType, **kwargs):
     def worker_start(self):
         config = app.config["config"]
 
-        deadline = datetime.now() + timedelta(seconds=2)
+        deadline = time.monotonic() + 2
 
         with config.open() as cfg:
             if not cfg:
@@ -52,7 +94,7 @@ def worker_start(self):
 
         while api.state != PPPPState.Connected:
             try:
-                msg = api.recv(timeout=(deadline - datetime.now()).total_seconds())
+                msg = api.recv(timeout=deadline - time.monotonic())
                 api.process(msg)
             except StopIteration:
                 raise ConnectionRefusedError("Connection rejected by device")
@@ -61,28 +103,26 @@ def worker_start(self):
         log.info("Established pppp connection")
         self._api = api
 
-    def _recv_aabb(self, fd):
-        data = fd.read(12)
-        aabb = Aabb.parse(data)[0]
-        p = data + fd.read(aabb.len + 2)
-        aabb, data = Aabb.parse_with_crc(p)[:2]
-        return aabb, data
-
     def worker_run(self, timeout):
+        api = self._api
         try:
-            msg = self._api.poll(timeout=timeout)
+            msg = api.poll(timeout=timeout)
         except ConnectionResetError:
-            raise ServiceRestartSignal()
+            self.request_restart()
+            return
 
         if not msg:
             return
 
         if msg.type != Type.DRW:
             # forward messages other than Type.DRW without further processing
-            self.notify((getattr(msg, "chan", None), msg))
+            # (only some message types have a channel)
+            if self.handlers:
+                self.notify((getattr(msg, "chan", None), msg))
             return
 
-        ch = self._api.chans[msg.chan]
+        chan = msg.chan
+        ch = api.chans[chan]
 
         with ch.lock:
             data = ch.peek(16, timeout=0)
@@ -90,33 +130,34 @@ def worker_run(self, timeout):
                 return
 
             if data[:4] == b'XZYH':
-                hdr = ch.peek(16, timeout=0)
-                if not hdr:
-                    return
-
-                xzyh = Xzyh.parse(hdr)[0]
+                xzyh = Xzyh.parse(data)[0]
                 data = ch.read(xzyh.len + 16, timeout=0)
                 if not data:
                     return None
 
                 xzyh.data = data[16:]
-                self.notify((msg.chan, xzyh))
+                self.notify_msg(chan, xzyh)
             elif data[:2] == b'\xAA\xBB':
-                aabb, data = self._recv_aabb(ch)
+                aabb, data = api.recv_aabb(chan=chan)
                 if len(data) != 1:
                     raise ValueError(f"Unexpected reply from aabb request: {data}")
 
                 aabb.data = data
-                self.notify((msg.chan, aabb))
+                self.notify_msg(chan, aabb)
             else:
                 raise ValueError(f"Unexpected data in stream: {data!r}")
 
     def worker_stop(self):
-        self._api.send(PktClose())
-        del self._api
+        api = self._api
+        self._api = None
+        try:
+            api.send(PktClose())
+        except (OSError, ConnectionError) as E:
+            log.warning(f"{self.name}: Failed to send close packet ({E})")
+        finally:
+            api.close()
 
     @property
     def connected(self):
-        if not hasattr(self, "_api"):
-            return False
-        return self._api.state == PPPPState.Connected
+        api = self._api
+        return api is not None and api.state == PPPPState.Connected
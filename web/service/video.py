@@ -1,47 +1,57 @@
-import json
 import logging as log
 
-from queue import Empty
-from multiprocessing import Queue
+from functools import lru_cache
 
-from ..lib.service import Service, ServiceRestartSignal
+from ..lib.service import Service
 from .. import app
+from .pppp import PPPPService
 
 from libflagship.pppp import P2PSubCmdType, Xzyh
+from libflagship.ppppapi import PPPPState
+
+
+# the video control commands have (almost) constant payloads, so encode them
+# once instead of on every call
+START_LIVE_CMD = PPPPService.encode_command(P2PSubCmdType.START_LIVE, data={
+    "encryptkey": "x",
+    "accountId": "y",
+})
+
+CLOSE_LIVE_CMD = PPPPService.encode_command(P2PSubCmdType.CLOSE_LIVE)
+
+
+@lru_cache(maxsize=4, typed=True)
+def light_state_cmd(light):
+    return PPPPService.encode_command(P2PSubCmdType.LIGHT_STATE_SWITCH, data={
+        "open": light,
+    })
+
+
+@lru_cache(maxsize=4, typed=True)
+def video_mode_cmd(mode):
+    return PPPPService.encode_command(P2PSubCmdType.LIVE_MODE_SET, data={
+        "mode": mode
+    })
 
 
 class VideoQueue(Service):
 
     def api_start_live(self):
-        self.pppp.api_command(P2PSubCmdType.START_LIVE, data={
-            "encryptkey": "x",
-            "accountId": "y",
-        })
+        self.pppp.api_command_encoded(START_LIVE_CMD)
 
     def api_stop_live(self):
-        self.pppp.api_command(P2PSubCmdType.CLOSE_LIVE)
+        self.pppp.api_command_encoded(CLOSE_LIVE_CMD)
 
     def api_light_state(self, light):
         self.saved_light_state = light
-        self.pppp.api_command(P2PSubCmdType.LIGHT_STATE_SWITCH, data={
-            "open": light,
-        })
+        self.pppp.api_command_encoded(light_state_cmd(light))
 
     def api_video_mode(self, mode):
         self.saved_video_mode = mode
-        self.pppp.api_command(P2PSubCmdType.LIVE_MODE_SET, data={
-            "mode": mode
-        })
+        self.pppp.api_command_encoded(video_mode_cmd(mode))
 
     def _handler(self, data):
         chan, msg = data
-
-        if chan != 1:
-            return
-
-        if not isinstance(msg, Xzyh):
-            return
-
         self.notify(msg)
 
     def worker_init(self):
@@ -51,9 +61,11 @@ def worker_init(self):
     def worker_start(self):
         self.pppp = app.svc.get("pppp")
 
-        self.api_id = id(self.pppp._api)
+        # keep a reference rather than id(), since the id of a discarded api
+        # object can be reused by its replacement
+        self.pppp_api = self.pppp._api
 
-        self.pppp.handlers.append(self._handler)
+        self.pppp.add_msg_handler(1, Xzyh, self._handler)
 
         self.api_start_live()
 
@@ -66,11 +78,15 @@ def worker_start(self):
     def worker_run(self, timeout):
         self.idle(timeout=timeout)
 
-        if not self.pppp.connected:
-            raise ServiceRestartSignal("No pppp connection")
+        # common case: still using the same, connected api
+        api = self.pppp._api
+        if api is not None and api is self.pppp_api and api.state == PPPPState.Connected:
+            return
 
-        if id(self.pppp._api) != self.api_id:
-            raise ServiceRestartSignal("New pppp connection detected, restarting video feed")
+        if not self.pppp.connected:
+            self.request_restart("No pppp connection")
+        else:
+            self.request_restart("New pppp connection detected, restarting video feed")
 
     def worker_stop(self):
         try:
@@ -78,6 +94,9 @@ def worker_stop(self):
         except Exception as E:
             log.warning(f"{self.name}: Failed to send stop command ({E})")
 
-        self.pppp.handlers.remove(self._handler)
+        self.pppp.remove_msg_handler(1, Xzyh, self._handler)
+
+        # drop the reference, so the discarded api object can be freed
+        self.pppp_api = None
 
         app.svc.put("pppp")